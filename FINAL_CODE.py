@@ -1,9 +1,20 @@
+import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib
+matplotlib.use('Agg') # Render off-screen; Streamlit only needs the rasterized image
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import streamlit as st
+import io
+import os
 import sys
 
+try:
+    from numba import njit
+except ImportError: # Numba is optional; NumPy fallbacks are used without it
+    njit = None
+
 # Set Streamlit page configuration early
 st.set_page_config(layout="wide", page_title="ATP Tennis Analyzer")
 
@@ -68,17 +79,74 @@ def get_comparison_colors(player1, player2):
 # -----------------------------------------
 # DATA LOADING (Adapted for Streamlit caching)
 # -----------------------------------------
+# Empty row-position array returned for players with no matches
+NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+def read_matches(filename, cache_filename):
+    """
+    Reads the cleaned match table. The first run parses the CSV and saves a
+    Parquet copy next to it; later runs load that copy while it is newer than the CSV.
+    """
+    if os.path.exists(cache_filename) and os.path.getmtime(cache_filename) >= os.path.getmtime(filename):
+        return pd.read_parquet(cache_filename, engine='pyarrow')
+
+    # Load only the columns the app uses, building the categoricals while parsing
+    category_cols = ['Player_1', 'Player_2', 'Winner', 'Surface', 'Round']
+    csv_options = dict(usecols=['Date'] + category_cols, dtype={col: 'category' for col in category_cols})
+    try:
+        # PyArrow's multithreaded parser skips building a Python string per cell
+        df = pd.read_csv(filename, engine='pyarrow', **csv_options)
+    except ImportError:
+        df = pd.read_csv(filename, **csv_options)
+    # Dates are stored as month/day/year (e.g. 1/3/2000); a fixed format skips per-row inference
+    df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y', errors='coerce')
+    # Drop rows where date conversion failed or are incomplete
+    df.dropna(subset=['Date', 'Winner', 'Player_1', 'Player_2', 'Surface', 'Round'], inplace=True)
+    # Keep rows in date order so any year range is one contiguous block of positions
+    df.sort_values(by='Date', kind='mergesort', inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    df['Year'] = df['Date'].dt.year.astype(np.int16) # Years fit in 2 bytes per row
+
+    try:
+        df.to_parquet(cache_filename, engine='pyarrow', compression='zstd')
+    except (ImportError, OSError):
+        # The cache is only a speed-up; without pyarrow or write access we simply re-parse next time
+        pass
+    return df
+
+
 @st.cache_data
 def load_data():
-    """Loads and preprocesses the ATP tennis dataset."""
+    """
+    Loads and preprocesses the ATP tennis dataset.
+    Returns the DataFrame plus two lookups mapping each player name to the
+    row positions of their matches and of their wins.
+    """
     filename = 'atp_tennis_.csv'
+    cache_filename = 'atp_tennis_.parquet'
     try:
-        df = pd.read_csv(filename)
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        # Drop rows where date conversion failed or are incomplete
-        df.dropna(subset=['Date', 'Winner', 'Player_1', 'Player_2', 'Surface', 'Round'], inplace=True)
-        df['Year'] = df['Date'].dt.year
-        return df
+        df = read_matches(filename, cache_filename)
+
+        # Categoricals make comparisons and groupbys work on integer codes. The player
+        # columns are given one shared category list (Parquet keeps only used values).
+        players = df['Player_1'].cat.categories.union(df['Player_2'].cat.categories)
+        player_dtype = pd.CategoricalDtype(categories=players)
+        for col in ['Player_1', 'Player_2', 'Winner']:
+            df[col] = df[col].astype(player_dtype)
+
+        # Build the per-player row indexes once so each plot gathers only that player's rows
+        # (lookups are by name, so group order is irrelevant and sorting is skipped)
+        p1_rows = df.groupby('Player_1', observed=True, sort=False).indices
+        p2_rows = df.groupby('Player_2', observed=True, sort=False).indices
+        win_rows = df.groupby('Winner', observed=True, sort=False).indices
+
+        player_matches = {
+            player: np.union1d(p1_rows.get(player, NO_ROWS), p2_rows.get(player, NO_ROWS))
+            for player in set(p1_rows) | set(p2_rows)
+        }
+        player_wins = {player: win_rows.get(player, NO_ROWS) for player in player_matches}
+        return df, player_matches, player_wins
     except FileNotFoundError:
         st.error(f"❌ Error: '{filename}' not found. Please ensure the file is correctly uploaded.")
         return None
@@ -87,17 +155,71 @@ def load_data():
         return None
 
 # -----------------------------------------
-# HELPER FUNCTION FOR STATS
+# HELPER FUNCTIONS FOR STATS
 # -----------------------------------------
-def get_player_stats(df, player_name):
+def get_year_bounds(df, year_range):
+    """Returns the [start, stop) row positions covering the year range in the date-sorted data."""
+    return np.searchsorted(df['Year'].to_numpy(), [year_range[0], year_range[1] + 1])
+
+
+def get_player_positions(df, row_index, player_name, year_range):
+    """Returns the row positions listed for a player in a row index, limited to the year range."""
+    rows = row_index.get(player_name, NO_ROWS)
+    # Row positions are ascending, so the year range is a slice of them as well
+    start, stop = np.searchsorted(rows, get_year_bounds(df, year_range))
+    return rows[start:stop]
+
+
+def get_player_rows(df, row_index, player_name, year_range):
+    """Gathers the rows listed for a player in a row index, limited to the year range."""
+    return df.iloc[get_player_positions(df, row_index, player_name, year_range)]
+
+
+# Head-to-head frames kept in the cache; the least recently used pairings are dropped first
+H2H_CACHE_SIZE = 64
+
+
+@st.cache_data(max_entries=H2H_CACHE_SIZE)
+def get_h2h(_df, _player_matches, player1, player2, year_range):
+    """
+    Gathers the head-to-head matches between two players within the year range,
+    in date order. Cached on the players and years only; the underscored
+    arguments are the session-wide dataset and are not hashed.
+    """
+    # Rows come back in position order, which is already date order
+    p1_matches = get_player_rows(_df, _player_matches, player1, year_range)
+    return p1_matches[(p1_matches['Player_1'] == player2) | (p1_matches['Player_2'] == player2)]
+
+
+if njit is not None:
+    @njit(cache=True)
+    def count_annual_wins(year_offsets, is_win, n_years):
+        """Counts matches and wins per year offset in one compiled pass."""
+        totals = np.zeros(n_years, np.int32)
+        wins = np.zeros(n_years, np.int32)
+        for i in range(year_offsets.size):
+            year = year_offsets[i]
+            totals[year] += 1
+            wins[year] += is_win[i]
+        return totals, wins
+else:
+    def count_annual_wins(year_offsets, is_win, n_years):
+        """Counts matches and wins per year offset with NumPy bincounts."""
+        totals = np.bincount(year_offsets, minlength=n_years)
+        wins = np.bincount(year_offsets, weights=is_win, minlength=n_years).astype(np.int64)
+        return totals, wins
+
+
+def get_player_stats(df, player_matches, player_wins, player_name, year_range):
     """Helper function to calculate key career stats for one player."""
-    player_matches = df[(df['Player_1'] == player_name) | (df['Player_2'] == player_name)].copy()
-    wins = (player_matches['Winner'] == player_name).sum()
-    total_matches = len(player_matches)
+    # Only the win rows are needed as a frame; matches are just counted
+    total_matches = len(get_player_positions(df, player_matches, player_name, year_range))
+    wins_df = get_player_rows(df, player_wins, player_name, year_range)
+    wins = len(wins_df)
     win_rate = (wins / total_matches) * 100 if total_matches > 0 else 0
     
-    # Calculate wins by surface
-    surface_wins = player_matches[player_matches['Winner'] == player_name].groupby('Surface').size().reset_index(name='Wins')
+    # Calculate wins by surface (kept sorted: the bar charts show surfaces in this order)
+    surface_wins = wins_df.groupby('Surface', observed=True, sort=True).size().reset_index(name='Wins')
     surface_wins['Player'] = player_name
     
     return total_matches, win_rate, surface_wins
@@ -107,59 +229,100 @@ def get_player_stats(df, player_name):
 # PLOTTING FUNCTIONS
 # -----------------------------------------
 
-def plot_annual_win_rate(df, player_name):
+# Finished charts are cached per chart input and shared between sessions as
+# PNG bytes, so no session ever draws on a Figure another session can see
+FIGURE_CACHE_SIZE = 32
+
+
+def new_figure(figsize):
+    """
+    Returns a new figure and axes. These are plain Figure objects rather than
+    pyplot figures, so charts never pile up in pyplot.
+    """
+    fig = Figure(figsize=figsize)
+    return fig, fig.add_subplot()
+
+
+def render_png(fig):
+    """Renders a finished figure to PNG bytes, with the same settings st.pyplot uses."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def show_figure(png):
+    """Displays a (possibly cached) rendered chart in the app."""
+    st.image(png)
+
+
+def plot_annual_win_rate(df, player_matches, player_name, year_range):
     """Generates and displays a line chart of the player's annual win rate."""
     st.subheader(f"{player_name}'s Annual Win Rate Trend")
     
-    player_matches = df[(df['Player_1'] == player_name) | (df['Player_2'] == player_name)].copy()
+    matches = get_player_rows(df, player_matches, player_name, year_range)
 
-    if player_matches.empty:
+    if matches.empty:
         st.info(f"No match data available for {player_name} in the selected period.")
         return
 
-    # Calculate wins and total matches per year
-    yearly_stats = player_matches.groupby('Year').agg(
-        Total_Matches=('Date', 'count'),
-        Wins=('Winner', lambda x: (x == player_name).sum())
-    ).reset_index()
+    # Calculate wins and total matches per year, skipping years without matches
+    years = matches['Year'].to_numpy()
+    first_year = int(years.min())
+    year_offsets = (years - first_year).astype(np.int32)
+    is_win = (matches['Winner'] == player_name).to_numpy().astype(np.int8)
+    totals, wins = count_annual_wins(year_offsets, is_win, int(years.max()) - first_year + 1)
+    played = np.flatnonzero(totals)
+    yearly_stats = pd.DataFrame({
+        'Year': played + first_year,
+        'Total_Matches': totals[played],
+        'Wins': wins[played],
+    })
 
     # Calculate win rate
     yearly_stats['Win_Rate'] = (yearly_stats['Wins'] / yearly_stats['Total_Matches']) * 100
 
     if not yearly_stats.empty:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        player_color = get_player_color(player_name)
-        
-        ax.plot(yearly_stats['Year'], yearly_stats['Win_Rate'], 
-                marker='o', linestyle='-', color=player_color, linewidth=2, markersize=6)
-        
-        ax.set_title(f"{player_name} Winning Percentage by Year", fontsize=14)
-        ax.set_xlabel("Year", fontsize=12)
-        ax.set_ylabel("Win Rate (%)", fontsize=12)
-        ax.grid(True, linestyle='--', alpha=0.6)
-        ax.set_ylim(0, 100) # Win rate is between 0 and 100
-
-        # Adjust x-axis ticks to show only integer years
-        years = yearly_stats['Year'].unique()
-        # Show a maximum of 10 ticks for readability
-        step = max(1, len(years) // 10)
-        ax.set_xticks(years[::step]) 
-        
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        st.pyplot(fig)
+        png = build_annual_win_rate_figure(
+            player_name, tuple(yearly_stats['Year'].tolist()), tuple(yearly_stats['Win_Rate'].tolist())
+        )
+        show_figure(png)
     else:
         st.info("No yearly data found to plot the trend.")
 
 
-def plot_career_stats(df, player_name):
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_annual_win_rate_figure(player_name, years, win_rates):
+    """Builds the annual win rate line chart from (year, win rate) tuples."""
+    fig, ax = new_figure(figsize=(10, 6))
+    
+    player_color = get_player_color(player_name)
+    
+    ax.plot(years, win_rates, 
+            marker='o', linestyle='-', color=player_color, linewidth=2, markersize=6)
+    
+    ax.set_title(f"{player_name} Winning Percentage by Year", fontsize=14)
+    ax.set_xlabel("Year", fontsize=12)
+    ax.set_ylabel("Win Rate (%)", fontsize=12)
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.set_ylim(0, 100) # Win rate is between 0 and 100
+
+    # Adjust x-axis ticks to show only integer years
+    # Show a maximum of 10 ticks for readability
+    step = max(1, len(years) // 10)
+    ax.set_xticks(years[::step]) 
+    
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return render_png(fig)
+
+
+def plot_career_stats(df, player_matches, player_wins, player_name, year_range):
     """Generates and displays career statistics for a selected player (Original and calls new trend)."""
     
-    total_matches, win_rate, surface_wins_df = get_player_stats(df, player_name)
+    total_matches, win_rate, surface_wins_df = get_player_stats(df, player_matches, player_wins, player_name, year_range)
 
     if total_matches == 0:
-        st.info(f"No matches found for {player_name} in the selected time frame ({df['Year'].min()} - {df['Year'].max()}).")
+        st.info(f"No matches found for {player_name} in the selected time frame ({year_range[0]} - {year_range[1]}).")
         return
     
     wins = (total_matches * win_rate / 100) # Calculate wins from total and rate
@@ -173,7 +336,7 @@ def plot_career_stats(df, player_name):
     st.markdown("---")
     
     # NEW CHART 1: Annual Win Rate Trend
-    plot_annual_win_rate(df, player_name)
+    plot_annual_win_rate(df, player_matches, player_name, year_range)
 
     st.markdown("---")
     st.subheader("Wins by Surface")
@@ -182,28 +345,37 @@ def plot_career_stats(df, player_name):
     surface_wins = surface_wins_df.set_index('Surface')['Wins']
 
     if not surface_wins.empty:
-        fig, ax = plt.subplots(figsize=(8, 5))
-        surface_wins.plot(kind='bar', ax=ax, color=get_player_color(player_name))
-        ax.set_title(f"{player_name} Wins by Surface")
-        ax.set_ylabel("Number of Wins")
-        ax.set_xlabel("Surface")
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        st.pyplot(fig)
+        png = build_surface_wins_figure(player_name, tuple(surface_wins.items()))
+        show_figure(png)
     else:
         st.info("No wins recorded in this range.")
 
+
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_surface_wins_figure(player_name, surface_counts):
+    """Builds the wins-by-surface bar chart from (surface, wins) pairs."""
+    surface_wins = pd.Series(dict(surface_counts))
+
+    fig, ax = new_figure(figsize=(8, 5))
+    surface_wins.plot(kind='bar', ax=ax, color=get_player_color(player_name))
+    ax.set_title(f"{player_name} Wins by Surface")
+    ax.set_ylabel("Number of Wins")
+    ax.set_xlabel("Surface")
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return render_png(fig)
+
 # -----------------------------------------
 # COMPARISON FUNCTION (Lifetime Comparison)
 # -----------------------------------------
 
-def plot_player_comparison(df, player1, player2):
+def plot_player_comparison(df, player_matches, player_wins, player1, player2, year_range):
     """Generates and displays comparison statistics for two selected players."""
     st.header(f"⚖️ Lifetime Career Comparison: {player1} vs {player2}")
 
     # 1. Get stats for both players
-    total1, rate1, surface_wins1 = get_player_stats(df, player1)
-    total2, rate2, surface_wins2 = get_player_stats(df, player2)
+    total1, rate1, surface_wins1 = get_player_stats(df, player_matches, player_wins, player1, year_range)
+    total2, rate2, surface_wins2 = get_player_stats(df, player_matches, player_wins, player2, year_range)
 
     # 2. Display summary metrics side-by-side
     st.subheader("Overall Performance")
@@ -240,18 +412,33 @@ def plot_player_comparison(df, player1, player2):
     # 3. Surface Wins Comparison (Grouped Bar Chart)
     st.subheader("Wins by Surface Comparison")
     
-    # Combine dataframes
-    combined_surface_wins = pd.concat([surface_wins1, surface_wins2])
-    
-    if combined_surface_wins.empty:
+    if surface_wins1.empty and surface_wins2.empty:
         st.info("No wins recorded for these players in the selected range.")
         return
 
+    png = build_surface_comparison_figure(
+        player1, player2,
+        tuple(zip(surface_wins1['Surface'], surface_wins1['Wins'])),
+        tuple(zip(surface_wins2['Surface'], surface_wins2['Wins']))
+    )
+    show_figure(png)
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_surface_comparison_figure(player1, player2, surface_counts1, surface_counts2):
+    """Builds the grouped wins-by-surface bar chart from each player's (surface, wins) pairs."""
+    # Combine both players' counts into one long-form table
+    combined_surface_wins = pd.DataFrame(
+        [(surface, wins, player1) for surface, wins in surface_counts1] +
+        [(surface, wins, player2) for surface, wins in surface_counts2],
+        columns=['Surface', 'Wins', 'Player']
+    )
+
     # Get distinct comparison colors
     color1, color2 = get_comparison_colors(player1, player2)
 
     # Create the grouped bar chart using Matplotlib/Seaborn
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = new_figure(figsize=(10, 6))
     sns.barplot(
         x='Surface', 
         y='Wins', 
@@ -265,42 +452,49 @@ def plot_player_comparison(df, player1, player2):
     ax.set_ylabel("Number of Wins", fontsize=12)
     ax.set_xlabel("Surface", fontsize=12)
     ax.legend(title="Player")
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    st.pyplot(fig)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return render_png(fig)
 
 
-def plot_h2h_trend(df, player1, player2):
+def plot_h2h_trend(h2h_matches, player1, player2):
     """Plots the cumulative head-to-head score over time."""
     st.subheader(f"Historical Head-to-Head Trend ({player1} vs {player2})")
 
-    h2h_matches = df[((df['Player_1'] == player1) & (df['Player_2'] == player2)) | 
-                     ((df['Player_1'] == player2) & (df['Player_2'] == player1))].sort_values(by='Date').copy()
-
     if h2h_matches.empty:
         return # Handled in summary function
     
     # Calculate who won each match (1 if Player 1 won, 0 otherwise)
-    h2h_matches['P1_Win'] = (h2h_matches['Winner'] == player1).astype(int)
-    h2h_matches['P2_Win'] = (h2h_matches['Winner'] == player2).astype(int)
+    p1_win = (h2h_matches['Winner'] == player1).to_numpy().astype(np.int8)
+
+    png = build_h2h_trend_figure(player1, player2, tuple(p1_win.tolist()))
+    show_figure(png)
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_h2h_trend_figure(player1, player2, p1_win):
+    """Builds the cumulative head-to-head chart from the chronological Player 1 win flags."""
+    # Every H2H match is won by one of the two, so Player 2's wins are the complement
+    p1_win = np.array(p1_win, dtype=np.int8)
+    p2_win = 1 - p1_win
 
     # Calculate cumulative score
-    h2h_matches['P1_Cumulative_Wins'] = h2h_matches['P1_Win'].cumsum()
-    h2h_matches['P2_Cumulative_Wins'] = h2h_matches['P2_Win'].cumsum()
-    h2h_matches['Match_Number'] = range(1, len(h2h_matches) + 1)
+    p1_cumulative_wins = p1_win.cumsum()
+    p2_cumulative_wins = p2_win.cumsum()
+    match_number = np.arange(1, len(p1_win) + 1)
 
     # Get distinct comparison colors
     color1, color2 = get_comparison_colors(player1, player2)
 
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = new_figure(figsize=(10, 6))
     
     # Plotting Player 1's cumulative wins
-    ax.plot(h2h_matches['Match_Number'], h2h_matches['P1_Cumulative_Wins'], 
+    ax.plot(match_number, p1_cumulative_wins, 
             label=player1, marker='o', linestyle='-', color=color1, linewidth=2) # Use color1
     
     # Plotting Player 2's cumulative wins
-    ax.plot(h2h_matches['Match_Number'], h2h_matches['P2_Cumulative_Wins'], 
+    ax.plot(match_number, p2_cumulative_wins, 
             label=player2, marker='s', linestyle='--', color=color2, linewidth=2) # Use color2
 
     ax.set_title(f"{player1} vs {player2}: Head-to-Head History", fontsize=14)
@@ -308,15 +502,12 @@ def plot_h2h_trend(df, player1, player2):
     ax.set_ylabel("Cumulative Wins", fontsize=12)
     ax.legend(loc='upper left')
     ax.grid(True, linestyle='--', alpha=0.6)
-    plt.tight_layout()
-    st.pyplot(fig)
+    fig.tight_layout()
+    return render_png(fig)
 
 
-def plot_h2h_summary(df, player1, player2):
+def plot_h2h_summary(h2h_matches, player1, player2):
     """Calculates and displays a summary and pie chart for Head-to-Head record."""
-    h2h_matches = df[((df['Player_1'] == player1) & (df['Player_2'] == player2)) | 
-                     ((df['Player_1'] == player2) & (df['Player_2'] == player1))].copy()
-
     if h2h_matches.empty:
         st.info(f"No Head-to-Head matches found between {player1} and {player2} in this range.")
         return
@@ -333,29 +524,33 @@ def plot_h2h_summary(df, player1, player2):
 
     if total > 0:
         # Pie Chart for H2H Wins
-        labels = [player1, player2]
-        sizes = [p1_wins, p2_wins]
-        
-        color1, color2 = get_comparison_colors(player1, player2) # Get comparison colors
-        colors = [color1, color2]
-
-        fig, ax = plt.subplots(figsize=(6, 6))
-        # Filter out 0 size slices for cleaner look
-        filtered_labels = [labels[i] for i, size in enumerate(sizes) if size > 0]
-        filtered_sizes = [size for size in sizes if size > 0]
-        filtered_colors = [colors[i] for i, size in enumerate(sizes) if size > 0]
-        
-        ax.pie(filtered_sizes, labels=filtered_labels, autopct='%1.1f%%', startangle=90, colors=filtered_colors, wedgeprops={'edgecolor': 'black', 'linewidth': 1})
-        ax.axis('equal') 
-        st.pyplot(fig)
+        png = build_h2h_pie_figure(player1, player2, int(p1_wins), int(p2_wins))
+        show_figure(png)
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_h2h_pie_figure(player1, player2, p1_wins, p2_wins):
+    """Builds the head-to-head wins pie chart."""
+    labels = [player1, player2]
+    sizes = [p1_wins, p2_wins]
+    
+    color1, color2 = get_comparison_colors(player1, player2) # Get comparison colors
+    colors = [color1, color2]
+
+    fig, ax = new_figure(figsize=(6, 6))
+    # Filter out 0 size slices for cleaner look (one pass over the slices)
+    slices = [(label, size, color) for label, size, color in zip(labels, sizes, colors) if size > 0]
+    filtered_labels, filtered_sizes, filtered_colors = zip(*slices)
+    
+    ax.pie(filtered_sizes, labels=filtered_labels, autopct='%1.1f%%', startangle=90, colors=filtered_colors, wedgeprops={'edgecolor': 'black', 'linewidth': 1})
+    ax.axis('equal') 
+    return render_png(fig)
+
 
-def plot_h2h_heatmap(df, player1, player2):
+def plot_h2h_heatmap(h2h_matches, player1, player2):
     """Generates the win difference heatmap by Surface and Round."""
     st.subheader("Win Difference by Surface and Round (Heatmap)")
     
-    h2h_matches = df[((df['Player_1'] == player1) & (df['Player_2'] == player2)) | 
-                     ((df['Player_1'] == player2) & (df['Player_2'] == player1))].copy()
-    
     if h2h_matches.empty:
         return # Handled in summary function
 
@@ -364,66 +559,97 @@ def plot_h2h_heatmap(df, player1, player2):
         st.warning("⚠️ Heatmap requires 'Surface' and 'Round' data, which is missing for some matches in this head-to-head.")
         return
 
-    # Logic adapted from the user's original snippet
-    p1_wins = h2h_matches[h2h_matches['Winner'] == player1]
-    p2_wins = h2h_matches[h2h_matches['Winner'] == player2]
-    
-    # Aggregate wins by Surface and Round
-    heat1 = p1_wins.groupby(["Surface", "Round"]).size().reset_index(name="P1")
-    heat2 = p2_wins.groupby(["Surface", "Round"]).size().reset_index(name="P2")
-    
-    # Merge, fill NaN with 0
-    merged = pd.merge(heat1, heat2, on=["Surface", "Round"], how="outer").fillna(0)
+    # Score each match +1 for a Player 1 win and -1 for a Player 2 win, then sum the
+    # scores into a dense Surface x Round grid indexed by the categorical codes
+    # (Player 1 Wins - Player 2 Wins per cell)
+    surfaces = h2h_matches['Surface'].cat.categories
+    rounds = h2h_matches['Round'].cat.categories
+    surface_codes = h2h_matches['Surface'].cat.codes.to_numpy()
+    round_codes = h2h_matches['Round'].cat.codes.to_numpy()
+    win_diff = np.where(h2h_matches['Winner'] == player1, 1, -1)
 
-    # Pivot P1 and P2
-    pivot_p1 = merged.pivot(index="Surface", columns="Round", values="P1").fillna(0)
-    pivot_p2 = merged.pivot(index="Surface", columns="Round", values="P2").fillna(0)
+    diff_grid = np.zeros((len(surfaces), len(rounds)), dtype=np.int32)
+    np.add.at(diff_grid, (surface_codes, round_codes), win_diff)
 
-    # Align indexes/columns
-    all_surfaces = sorted(set(pivot_p1.index) | set(pivot_p2.index))
-    all_rounds = sorted(set(pivot_p1.columns) | set(pivot_p2.columns))
+    # Keep only the surfaces and rounds these two actually played, in category order
+    played_surfaces = np.unique(surface_codes)
+    played_rounds = np.unique(round_codes)
+    values = diff_grid[np.ix_(played_surfaces, played_rounds)]
+    surface_labels = tuple(surfaces[played_surfaces])
+    round_labels = tuple(rounds[played_rounds])
 
-    pivot_p1 = pivot_p1.reindex(index=all_surfaces, columns=all_rounds, fill_value=0)
-    pivot_p2 = pivot_p2.reindex(index=all_surfaces, columns=all_rounds, fill_value=0)
+    png = build_h2h_heatmap_figure(player1, player2, values, surface_labels, round_labels)
+    show_figure(png)
 
-    # Calculate difference (Player 1 Wins - Player 2 Wins)
-    diff = pivot_p1 - pivot_p2
 
+@st.cache_data(max_entries=FIGURE_CACHE_SIZE)
+def build_h2h_heatmap_figure(player1, player2, values, surface_labels, round_labels):
+    """Builds the Surface x Round win difference heatmap from the dense grid and its labels."""
     # Plotting the heatmap
-    fig, ax = plt.subplots(figsize=(12, 8))
-    sns.heatmap(diff, 
-                cmap="coolwarm", 
-                center=0, 
-                annot=True, 
-                fmt=".0f", 
-                linewidths=.5, 
-                linecolor='lightgray',
-                cbar_kws={'label': f'Wins ({player1} - {player2})'})
+    fig, ax = new_figure(figsize=(12, 8))
+    n_surfaces, n_rounds = values.shape
+
+    # Symmetric color limits keep 0 (an even record) at the center of the colormap
+    abs_max = max(1, np.abs(values).max())
+    im = ax.imshow(values, cmap="coolwarm", vmin=-abs_max, vmax=abs_max, aspect='auto')
+    fig.colorbar(im, ax=ax, label=f'Wins ({player1} - {player2})')
+
+    # Annotate each cell with its win difference, in white on dark cells and dark grey
+    # on light ones (the relative-luminance cut-off sns.heatmap used)
+    rgb = im.cmap(im.norm(values))[..., :3]
+    rgb = np.where(rgb <= .03928, rgb / 12.92, ((rgb + .055) / 1.055) ** 2.4)
+    luminance = rgb @ np.array([.2126, .7152, .0722])
+    for (i, j), value in np.ndenumerate(values):
+        text_color = ".15" if luminance[i, j] > .408 else "w"
+        ax.text(j, i, f"{value:.0f}", ha='center', va='center', color=text_color)
+
+    # Label the cell centers and draw light gridlines on the cell borders
+    ax.set_xticks(np.arange(n_rounds))
+    ax.set_xticklabels(round_labels)
+    ax.set_yticks(np.arange(n_surfaces))
+    ax.set_yticklabels(surface_labels)
+    ax.set_xticks(np.arange(n_rounds + 1) - .5, minor=True)
+    ax.set_yticks(np.arange(n_surfaces + 1) - .5, minor=True)
+    ax.grid(which='minor', color='lightgray', linewidth=.5)
+    ax.tick_params(which='minor', length=0)
     
     ax.set_title(f"{player1} vs {player2} – Win Difference by Surface/Round")
     ax.set_xlabel("Round")
     ax.set_ylabel("Surface")
-    plt.yticks(rotation=0)
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    st.pyplot(fig)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    fig.tight_layout()
+    return render_png(fig)
 
 
 # -----------------------------------------
 # MAIN STREAMLIT APPLICATION
 # -----------------------------------------
+@st.cache_data
+def get_all_players(_df):
+    """
+    Returns the sorted list of player names for the selection widgets, plus a
+    name -> list position lookup for picking default selections.
+    These are the categories shared by the player columns. The dataset argument
+    is not hashed, so both are built once rather than on every rerun.
+    """
+    all_players = _df['Player_1'].cat.categories.tolist()
+    player_pos = {player: i for i, player in enumerate(all_players)}
+    return all_players, player_pos
+
+
 def main_app():
     """Main function to run the Streamlit app."""
     
     st.title("🎾 ATP Tennis Match Analyzer")
     st.caption("Analyze career statistics and head-to-head records using the provided match data.")
     
-    df = load_data()
-    if df is None:
+    data = load_data()
+    if data is None:
         return
+    df, player_matches, player_wins = data
 
     # Extract all unique player names
-    all_players = sorted(pd.concat([df['Player_1'], df['Player_2']]).unique())
+    all_players, player_pos = get_all_players(df)
 
     # --- SIDEBAR (SELECTIONS) ---
     st.sidebar.header("⚙️ Analysis Settings")
@@ -434,9 +660,9 @@ def main_app():
         ("Career Stats", "Head-to-Head Comparison", "Two-Player Lifetime Comparison")
     )
     
-    # Year Range Slider
-    min_year = int(df['Year'].min())
-    max_year = int(df['Year'].max())
+    # Year Range Slider (rows are sorted by date, so the first and last rows hold the year bounds)
+    min_year = int(df['Year'].iat[0])
+    max_year = int(df['Year'].iat[-1])
     year_range = st.sidebar.slider(
         "Select Year Range:",
         min_value=min_year,
@@ -445,16 +671,13 @@ def main_app():
         step=1
     )
     
-    # Filter data by year range
-    df_filtered = df[(df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1])].copy()
-    
     # --- ANALYSIS LOGIC ---
     
     if analysis_mode == "Career Stats":
         st.header("📊 Player Career Statistics")
         
         # Determine the default player for career stats
-        default_index = all_players.index("Roger Federer") if "Roger Federer" in all_players else 0
+        default_index = player_pos.get("Roger Federer", 0)
         
         selected_player = st.selectbox(
             "Select a Player for Career Analysis:",
@@ -463,7 +686,7 @@ def main_app():
         )
         
         if selected_player:
-            plot_career_stats(df_filtered, selected_player)
+            plot_career_stats(df, player_matches, player_wins, selected_player, year_range)
 
     elif analysis_mode == "Head-to-Head Comparison":
         st.header("⚔️ Head-to-Head Matchup Comparison")
@@ -471,8 +694,8 @@ def main_app():
         col1, col2 = st.columns(2)
         
         # Determine default players for Head-to-Head
-        default_p1_idx = all_players.index("Roger Federer") if "Roger Federer" in all_players else 0
-        default_p2_idx = all_players.index("Rafael Nadal") if "Rafael Nadal" in all_players else (1 if len(all_players) > 1 else 0)
+        default_p1_idx = player_pos.get("Roger Federer", 0)
+        default_p2_idx = player_pos.get("Rafael Nadal", 1 if len(all_players) > 1 else 0)
 
         with col1:
             player1 = st.selectbox("Player 1:", all_players, index=default_p1_idx)
@@ -483,11 +706,13 @@ def main_app():
         st.markdown("---")
 
         if player1 and player2 and player1 != player2:
-            plot_h2h_summary(df_filtered, player1, player2)
+            # Filter the head-to-head matches once and share them across the three views
+            h2h_matches = get_h2h(df, player_matches, player1, player2, year_range)
+            plot_h2h_summary(h2h_matches, player1, player2)
             st.markdown("---")
-            plot_h2h_trend(df_filtered, player1, player2)
+            plot_h2h_trend(h2h_matches, player1, player2)
             st.markdown("---")
-            plot_h2h_heatmap(df_filtered, player1, player2)
+            plot_h2h_heatmap(h2h_matches, player1, player2)
         elif player1 == player2:
             st.warning("Please select two different players for Head-to-Head comparison.")
         else:
@@ -500,8 +725,8 @@ def main_app():
         col1, col2 = st.columns(2)
         
         # Determine default players for comparison
-        default_p1_idx = all_players.index("Roger Federer") if "Roger Federer" in all_players else 0
-        default_p2_idx = all_players.index("Novak Djokovic") if "Novak Djokovic" in all_players else (1 if len(all_players) > 1 else 0)
+        default_p1_idx = player_pos.get("Roger Federer", 0)
+        default_p2_idx = player_pos.get("Novak Djokovic", 1 if len(all_players) > 1 else 0)
 
         with col1:
             player1 = st.selectbox("Player 1 (Left Side):", all_players, key='comp1', index=default_p1_idx)
@@ -512,7 +737,7 @@ def main_app():
         st.markdown("---")
 
         if player1 and player2 and player1 != player2:
-            plot_player_comparison(df_filtered, player1, player2)
+            plot_player_comparison(df, player_matches, player_wins, player1, player2, year_range)
         elif player1 == player2:
             st.warning("Please select two different players for career comparison.")
         else:
@@ -1,28 +1,149 @@
+import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+import os
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-# --- 1. DATA LOADING (Same Logic) ---
+# Batch runs (output piped or redirected) have no window to show charts in, so they
+# render off-screen with Agg and save PNG files instead
+INTERACTIVE = sys.stdout.isatty()
+
+# Plotting libraries, imported by load_plotting the first time charts are requested
+plt = None
+sns = None
+
+# --- 1. DATA LOADING (Same Logic, cached as Parquet after the first run) ---
 def load_data():
     filename = 'atp_tennis_.csv'
+    cache_filename = filename + '.parquet'
+    # Columns the CLI uses, names as categoricals
+    category_cols = ['Player_1', 'Player_2', 'Winner', 'Surface']
     try:
         print("📂 Loading dataset...")
-        df = pd.read_csv(filename)
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df['Year'] = df['Date'].dt.year
+        if os.path.exists(cache_filename) and os.path.getmtime(cache_filename) > os.path.getmtime(filename):
+            # The cleaned frame (dates, sort order, categoricals) was saved by an earlier run
+            df = pd.read_parquet(cache_filename, engine='pyarrow', columns=['Date', 'Year'] + category_cols)
+        else:
+            csv_options = dict(usecols=['Date'] + category_cols, dtype={col: 'category' for col in category_cols})
+            try:
+                df = pd.read_csv(filename, engine='pyarrow', **csv_options)
+            except ImportError: # No pyarrow
+                df = pd.read_csv(filename, **csv_options)
+            # Dates look like 1/3/2000
+            df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y', errors='coerce')
+            df.dropna(subset=['Date'], inplace=True)
+            df['Year'] = df['Date'].dt.year.astype(np.int16)
+            # Sort by Year (stable) so every era is one contiguous block of rows
+            df = df.sort_values('Year', kind='mergesort').reset_index(drop=True)
+            try:
+                df.to_parquet(cache_filename, engine='pyarrow', compression='zstd')
+            except (ImportError, OSError):
+                pass # Caching is optional; the CSV is simply parsed again next run
         print("✅ Data loaded successfully!")
         return df
     except FileNotFoundError:
         print("❌ Error: 'atp_tennis_.csv' not found.")
         return None
 
-# --- 2. INTERACTIVE TERMINAL APP ---
+# --- 2. ERA & PLAYER CACHES (Built once, reused by every menu pass) ---
+# Menu choice -> (era name, first year, last year); None leaves that side open
+ERAS = {
+    '1': ("All Time", None, None),
+    '2': ("The 2000s", 2000, 2009),
+    '3': ("The 2010s", 2010, 2019),
+    '4': ("The 2020s", 2020, None),
+}
+
+def get_era_slice(df, first_year, last_year):
+    """Returns an era as a zero-copy slice of the Year-sorted data, found by binary search."""
+    years = df['Year'].to_numpy()
+    start = 0 if first_year is None else np.searchsorted(years, first_year, side='left')
+    stop = len(years) if last_year is None else np.searchsorted(years, last_year, side='right')
+    return df.iloc[start:stop]
+
+def precompute_era_counts(df):
+    """
+    Ranks the winners of every era once, keyed by menu choice, as (names, counts)
+    arrays ordered by most wins. Players level on wins keep the order in which they
+    first won in that era, so a longer top-N list only ever adds players at the end.
+    """
+    names = np.asarray(df['Winner'].cat.categories)
+    era_counts = {}
+    for key, (_, first_year, last_year) in ERAS.items():
+        codes = get_era_slice(df, first_year, last_year)['Winner'].cat.codes.to_numpy()
+        codes = codes[codes >= 0] # -1 marks a missing winner
+        # Tally wins per category code, listing each winner in order of their first win
+        counts = np.bincount(codes, minlength=len(names))
+        won, first_win = np.unique(codes, return_index=True)
+        won = won[np.argsort(first_win)]
+        ranked = won[np.argsort(-counts[won], kind='stable')]
+        era_counts[key] = (names[ranked], counts[ranked])
+    return era_counts
+
+def build_era_pivot(df):
+    """Builds the Year x Winner table of yearly top-3 win counts behind the era heatmap."""
+    wins_per_year = df.groupby(['Year', 'Winner'], observed=True).size().reset_index(name='Wins')
+    # Pick each year's three best with nlargest rather than sorting the whole table
+    top3_rows = wins_per_year.groupby('Year')['Wins'].nlargest(3).index.get_level_values(-1)
+    top3 = wins_per_year.loc[top3_rows]
+    # Only players who made a yearly top 3 get a column, in order of first appearance
+    keep = top3['Winner'].unique().tolist()
+    return top3.pivot(index='Year', columns='Winner', values='Wins').reindex(columns=keep)
+
+# Single worker that prepares the heatmap data while the user is busy with the menus
+BACKGROUND = ThreadPoolExecutor(max_workers=1)
+
+# --- 3. CHART OUTPUT ---
+def load_plotting():
+    """Imports matplotlib and seaborn on first use, so stats-only sessions never load them."""
+    global plt, sns
+    if plt is None:
+        import matplotlib
+        if not INTERACTIVE:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot
+        import seaborn
+        plt, sns = matplotlib.pyplot, seaborn
+
+# Chart figures are looked up by label so later menu passes reuse them instead of building new ones
+PLAYER_FIG = 'player_charts'
+HEATMAP_FIG = 'era_heatmap'
+
+def get_player_axes():
+    """Returns the two-panel player figure, clearing and reusing it while it is still open."""
+    if plt.fignum_exists(PLAYER_FIG):
+        fig = plt.figure(PLAYER_FIG)
+        ax1, ax2 = fig.axes
+        ax1.clear()
+        ax2.clear()
+        return fig, (ax1, ax2)
+    return plt.subplots(1, 2, figsize=(14, 6), num=PLAYER_FIG)
+
+def show_or_save(fig, filename):
+    """Shows a figure in a window, or saves it as a PNG when running in batch mode."""
+    if INTERACTIVE:
+        plt.show()
+    else:
+        fig.savefig(filename, dpi=100, bbox_inches='tight')
+        print(f"💾 Chart saved to {filename}")
+
+# --- 4. INTERACTIVE TERMINAL APP ---
 def main():
     df = load_data()
     if df is None:
         return
 
+    # The data never changes, so era counts and each player's row positions are computed up front
+    era_counts = precompute_era_counts(df)
+    winner_idx = df.groupby('Winner', observed=True, sort=False).indices
+    p1_idx = df.groupby('Player_1', observed=True, sort=False).indices
+    p2_idx = df.groupby('Player_2', observed=True, sort=False).indices
+    no_rows = np.empty(0, dtype=np.intp)
+    reports = {} # Player -> (matches played, wins, wins per surface, wins per year), filled on first selection
+    win_cols = df.columns.get_indexer(['Surface', 'Year']) # The only columns the report reads from a win
+    heatmap_data = BACKGROUND.submit(build_era_pivot, df) # Usually finished before it is asked for
+
     while True:
         print("\n" + "="*40)
         print("   🎾 ATP TENNIS ANALYZER (CLI MODE)")
@@ -42,43 +163,36 @@ def main():
             print("Goodbye! 👋")
             break
             
-        era_df = df.copy()
-        era_name = "All Time"
-        
-        if choice == '2':
-            era_df = df[(df['Year'] >= 2000) & (df['Year'] <= 2009)]
-            era_name = "The 2000s"
-        elif choice == '3':
-            era_df = df[(df['Year'] >= 2010) & (df['Year'] <= 2019)]
-            era_name = "The 2010s"
-        elif choice == '4':
-            era_df = df[df['Year'] >= 2020]
-            era_name = "The 2020s"
-        elif choice != '1':
+        if choice not in ERAS:
             print("⚠️ Invalid choice, defaulting to All Time.")
+            choice = '1'
+        era_name = ERAS[choice][0]
 
         # --- STEP 2: SELECT TOP N ---
         try:
             top_n_input = input("\n[Step 2] How many top players do you want to list? (e.g., 5, 10): ")
             top_n = int(top_n_input)
+            if top_n < 1:
+                raise ValueError # Zero or negative counts fall back to the default too
         except ValueError:
             print("⚠️ Invalid number. showing Top 5 by default.")
             top_n = 5
 
-        # Calculate Top Winners
-        top_winners = era_df['Winner'].value_counts().head(top_n)
-        top_players_list = top_winners.index.tolist()
+        # Pick Top Winners from the era's precomputed ranking
+        era_names, era_wins = era_counts[choice]
+        top_names, top_counts = era_names[:top_n], era_wins[:top_n]
+        top_n = len(top_names) # The era may have fewer winners than requested
 
         # --- STEP 3: SELECT PLAYER FROM LIST ---
         print(f"\n[Step 3] Top {top_n} Players of {era_name}:")
-        for idx, player in enumerate(top_players_list):
-            print(f"  {idx + 1}. {player} ({top_winners[player]} wins)")
+        for idx, (player, wins) in enumerate(zip(top_names, top_counts)):
+            print(f"  {idx + 1}. {player} ({wins} wins)")
         
         try:
             p_choice = input(f"\n👉 Select a player by number (1-{top_n}): ")
             p_index = int(p_choice) - 1
-            if 0 <= p_index < len(top_players_list):
-                selected_player = top_players_list[p_index]
+            if 0 <= p_index < top_n:
+                selected_player = top_names[p_index]
             else:
                 print("⚠️ Invalid number selected.")
                 continue
@@ -91,60 +205,74 @@ def main():
         print(f"📊 REPORT FOR: {selected_player.upper()}")
         print("-"*30)
         
-        # Calculate Stats (using full history for context)
-        # Matches where they played
-        p_matches = df[(df['Player_1'] == selected_player) | (df['Player_2'] == selected_player)]
-        p_wins = len(df[df['Winner'] == selected_player])
-        total_played = len(p_matches)
+        # Calculate Stats (using full history for context), once per player per session
+        if selected_player not in reports:
+            # Matches where they played (merge of their Player_1 and Player_2 row positions)
+            total_played = len(np.union1d(p1_idx.get(selected_player, no_rows), p2_idx.get(selected_player, no_rows)))
+            # One gather of their wins feeds the win count, the surface counts and the yearly chart
+            wins_df = df.iloc[winner_idx.get(selected_player, no_rows), win_cols]
+            reports[selected_player] = (
+                total_played,
+                len(wins_df),
+                # Best Surface (only a handful of surfaces, so a plain Counter beats value_counts)
+                Counter(wins_df['Surface'].dropna().tolist()),
+                wins_df.groupby('Year').size(),
+            )
+        total_played, p_wins, wins_by_surface, yearly_wins = reports[selected_player]
         win_rate = (p_wins / total_played * 100) if total_played > 0 else 0
         
         print(f"  • Total Career Matches: {total_played}")
         print(f"  • Total Career Wins:    {p_wins}")
         print(f"  • Career Win Rate:      {win_rate:.1f}%")
         
-        # Best Surface
-        if not p_matches.empty:
-            wins_by_surface = df[df['Winner'] == selected_player]['Surface'].value_counts()
-            if not wins_by_surface.empty:
-                best_surface = wins_by_surface.idxmax()
-                print(f"  • Best Surface:         {best_surface} ({wins_by_surface.max()} wins)")
+        if wins_by_surface:
+            best_surface, best_wins = wins_by_surface.most_common(1)[0]
+            print(f"  • Best Surface:         {best_surface} ({best_wins} wins)")
 
         # --- STEP 5: VISUALIZATIONS ---
         print("\n[Step 5] Visualization Options:")
         vis_choice = input("👉 Show charts? (y/n): ").lower()
         
         if vis_choice == 'y':
-            print("Generating charts... (Check the popup window)")
+            load_plotting()
+            print("Generating charts... (Check the popup window)" if INTERACTIVE else "Generating charts...")
             
-            # Setup a matplotlib figure with 2 subplots
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+            # Setup a matplotlib figure with 2 subplots (reused from the previous report if still open)
+            fig, (ax1, ax2) = get_player_axes()
             
             # Chart 1: Wins by Surface
-            surface_data = df[df['Winner'] == selected_player]['Surface'].value_counts()
-            sns.barplot(x=surface_data.index, y=surface_data.values, ax=ax1, palette="viridis")
+            surface_data = wins_by_surface.most_common()
+            positions = np.arange(len(surface_data))
+            # Same evenly spaced viridis shades seaborn's "viridis" palette would pick
+            bar_colors = plt.cm.viridis(np.linspace(0, 1, len(surface_data) + 2)[1:-1])
+            ax1.bar(positions, [wins for _, wins in surface_data], color=bar_colors)
+            ax1.set_xticks(positions)
+            ax1.set_xticklabels([surface for surface, _ in surface_data])
+            ax1.set_xlabel("Surface")
             ax1.set_title(f"{selected_player} - Wins by Surface")
             ax1.set_ylabel("Wins")
             
             # Chart 2: Wins Over Time
-            yearly_wins = df[df['Winner'] == selected_player].groupby('Year').size()
-            sns.lineplot(x=yearly_wins.index, y=yearly_wins.values, marker='o', ax=ax2, color='b')
+            ax2.plot(yearly_wins.index, yearly_wins.to_numpy(), marker='o', color='b')
+            ax2.set_xlabel("Year")
             ax2.set_title(f"{selected_player} - Wins per Year")
             ax2.set_ylabel("Wins")
             
-            plt.tight_layout()
-            plt.show()
+            fig.tight_layout()
+            show_or_save(fig, f"{selected_player.replace(' ', '_').replace('.', '')}_charts.png")
             
             # Bonus: Heatmap check
             heat_choice = input("👉 Show Global Era Heatmap? (y/n): ").lower()
             if heat_choice == 'y':
                 print("Generating heatmap...")
-                plt.figure(figsize=(14, 10))
-                wins_per_year = df.groupby(['Year', 'Winner']).size().reset_index(name='Wins')
-                top3 = wins_per_year.sort_values(['Year', 'Wins'], ascending=[True, False]).groupby('Year').head(3)
-                pivot_df = top3.pivot(index='Year', columns='Winner', values='Wins')
-                sns.heatmap(pivot_df, cmap='YlOrRd', annot=True, fmt='g')
-                plt.title("Top 3 Players by Wins (Yearly)")
-                plt.show()
+                if plt.fignum_exists(HEATMAP_FIG):
+                    # It covers the whole dataset, so an open heatmap is already up to date
+                    heat_fig = plt.figure(HEATMAP_FIG)
+                else:
+                    heat_fig = plt.figure(HEATMAP_FIG, figsize=(14, 10))
+                    sns.heatmap(heatmap_data.result(), cmap='YlOrRd', annot=True, fmt='g')
+                    plt.title("Top 3 Players by Wins (Yearly)")
+                show_or_save(heat_fig, "era_heatmap.png")
 
 if __name__ == "__main__":
     main()